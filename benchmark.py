@@ -0,0 +1,165 @@
+# Benchmarks for mtcs.py.
+#
+# Runs fixed-seed UCT searches on each of the example games and reports iterations, rollouts and
+# new tree nodes per second together with the peak memory of the process that ran the search.
+# Every case runs in a fresh worker process so that peak memory belongs to that case alone.
+#
+#   python benchmark.py                        # run every case
+#   python benchmark.py --save baseline.json   # ... and store the results
+#   python benchmark.py --compare baseline.json
+#
+# With --compare the exit status is 1 if any case got slower than the baseline by more than the
+# tolerance, so the benchmark can gate performance changes. Each case is timed at least --repeat
+# times and for at least --mintime seconds, and the fastest search counts: the noise of a loaded
+# machine only ever slows a search down, so the minimum is far steadier than the median.
+# A busy machine can still slow every search of a case for seconds at a time, so cases that look
+# slower are run again (--retries times) and judged by their fastest run before the gate fails.
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+from mtcs import *
+
+# (name, state constructor, iterations per search)
+cases = [
+    ("nim15", lambda: NimState(15), 5000),
+    ("multinim", lambda: MultiNimState((10, 20, 30, 40)), 2000),
+    ("oxo", lambda: OXOState(), 5000),
+    ("oxobitboard", lambda: OXOBitboardState(), 5000),
+    ("othello4", lambda: OthelloState(4), 2000),
+    ("othello6", lambda: OthelloState(6), 1000),
+    ("othello8", lambda: OthelloState(8), 500),
+    ("othellobitboard6", lambda: OthelloBitboardState(6), 1000),
+    ("othellobitboard8", lambda: OthelloBitboardState(8), 500),
+    ("gomoku15", lambda: MNKState(15, 15, 5), 1000),
+    ("zombie", lambda: ZombieDiceState(), 5000),
+]
+
+def PeakMemory():
+    """ Return the peak resident set size of this process in kilobytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": # bytes there, kilobytes elsewhere
+        peak //= 1024
+    return peak
+
+def RunCase(args):
+    """ Run one case in a worker process and return its measurements as a dict.
+        The first warmup search collects a UCTStats; as every search uses the same seed they all
+        do the same work, so the timed searches run without the overhead of counting it.
+    """
+    (name, itermax, seed, warmup, repeat, mintime, options) = args
+    makestate = dict([(c[0], c[1]) for c in cases])[name]
+    stats = UCTStats()
+    for i in range(max(warmup, 1)):
+        random.seed(seed)
+        UCT(makestate(), itermax, stats = stats if i == 0 else None, **options)
+    times = []
+    while len(times) < repeat or sum(times) < mintime:
+        state = makestate()
+        random.seed(seed)
+        start = time.time()
+        UCT(state, itermax, **options)
+        times.append(time.time() - start)
+    elapsed = min(times)
+    return {"iterations/s": stats.iterations / elapsed,
+            "rollouts/s": stats.calls["rollout"] / elapsed,
+            "nodes/s": stats.nodesCreated / elapsed,
+            "seconds": elapsed,
+            "peak KB": PeakMemory()}
+
+def Benchmark(names = None, seed = 0, warmup = 1, repeat = 5, scale = 1.0, mintime = 2.0, **options):
+    """ Run the named cases (all of them if None) and return a dict from case name to its
+        measurements. scale multiplies the iterations of every case. Each case repeats its search
+        at least repeat times and for at least mintime seconds. Other options are passed on to
+        UCT().
+    """
+    results = {}
+    for (name, makestate, itermax) in cases:
+        if names is not None and name not in names:
+            continue
+        pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+        try:
+            results[name] = pool.apply(RunCase, ((name, max(1, int(itermax * scale)), seed, warmup, repeat, mintime, options),))
+        finally:
+            pool.close()
+            pool.join()
+    return results
+
+rates = ["iterations/s", "rollouts/s", "nodes/s"] # the measurements compared against a baseline
+
+def Compare(results, baseline, tolerance = 0.1):
+    """ Print the change in each rate of every case against baseline and return the names of
+        the cases where any rate got slower by more than tolerance (a fraction).
+    """
+    slower = []
+    for name in sorted(results.keys()):
+        if name not in baseline:
+            print name + ": not in baseline"
+            continue
+        s = name + ":"
+        for rate in rates:
+            if not baseline[name].get(rate): # missing or zero, e.g. no nodes created
+                continue
+            ratio = results[name][rate] / baseline[name][rate]
+            s += " " + rate + " " + str(round(ratio, 3)) + "x"
+            if ratio < 1.0 - tolerance:
+                s += " SLOWER"
+                if name not in slower:
+                    slower.append(name)
+        print s
+    return slower
+
+def ResultsToString(results):
+    s = ""
+    for name in sorted(results.keys()):
+        r = results[name]
+        s += name + ": iterations/s:" + str(int(r["iterations/s"])) + " rollouts/s:" + str(int(r["rollouts/s"]))
+        s += " nodes/s:" + str(int(r["nodes/s"])) + " peak KB:" + str(r["peak KB"]) + "\n"
+    return s
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark UCT on the example games.")
+    parser.add_argument("cases", nargs = "*", help = "cases to run (default: all of " + ", ".join([c[0] for c in cases]) + ")")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--warmup", type = int, default = 1)
+    parser.add_argument("--repeat", type = int, default = 5, help = "least number of timed searches per case")
+    parser.add_argument("--mintime", type = float, default = 2.0, help = "least seconds of timed searches per case")
+    parser.add_argument("--scale", type = float, default = 1.0, help = "multiply the iterations of every case")
+    parser.add_argument("--storage", choices = ["nodes", "arrays"], default = "nodes")
+    parser.add_argument("--save", metavar = "FILE", help = "write the results to FILE as JSON")
+    parser.add_argument("--compare", metavar = "FILE", help = "compare against a baseline saved with --save")
+    parser.add_argument("--tolerance", type = float, default = 0.1, help = "allowed slowdown against the baseline")
+    parser.add_argument("--retries", type = int, default = 2, help = "times to run again the cases that look slower")
+    args = parser.parse_args()
+
+    results = Benchmark(args.cases or None, args.seed, args.warmup, args.repeat, args.scale, args.mintime, storage = args.storage)
+    print ResultsToString(results)
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent = 1, sort_keys = True)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = Compare(results, baseline, args.tolerance)
+        for i in range(args.retries):
+            if slower == []:
+                break
+            print "running again: " + ", ".join(slower)
+            again = Benchmark(slower, args.seed, args.warmup, args.repeat, args.scale, args.mintime, storage = args.storage)
+            for name in again:
+                if again[name]["seconds"] < results[name]["seconds"]:
+                    results[name] = again[name]
+            slower = Compare(results, baseline, args.tolerance)
+        if slower != []:
+            sys.exit(1)
@@ -0,0 +1,46 @@
+# Checks the Zobrist keys of the example games.
+#
+# Plays fixed-seed random games of each game with ZobristCollisionRate, which asserts that the
+# incrementally maintained keys match ComputeZobrist() and survive UndoMove(), and then asserts
+# that no two distinct positions shared a key.
+#
+#   python zobrist_check.py            # check every game
+#   python zobrist_check.py oxo zombie
+
+import argparse
+import random
+import sys
+
+from mtcs import *
+
+# (name, state constructor, describe for ZobristCollisionRate or None for the default)
+cases = [
+    ("nim", lambda: NimState(15), None),
+    ("multinim", lambda: MultiNimState((10, 20, 30, 40)), None),
+    ("oxo", lambda: OXOState(), None),
+    ("oxobitboard", lambda: OXOBitboardState(), None),
+    ("othello", lambda: OthelloState(6), None),
+    ("othellobitboard", lambda: OthelloBitboardState(6), None),
+    ("mnk", lambda: MNKState(7, 7, 4), None),
+    # the key ignores the order of the dice and the exact roll count, so describe by what it hashes
+    ("zombie", lambda: ZombieDiceState(), lambda st: (st.playerJustMoved, tuple(st.KeyFields()))),
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Check the Zobrist keys of the example games.")
+    parser.add_argument("cases", nargs = "*", help = "games to check (default: all of " + ", ".join([c[0] for c in cases]) + ")")
+    parser.add_argument("--games", type = int, default = 200)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    failed = []
+    for (name, makestate, describe) in cases:
+        if args.cases and name not in args.cases:
+            continue
+        random.seed(args.seed)
+        rate = ZobristCollisionRate(makestate, args.games, describe)
+        print name + ": collision rate " + str(rate)
+        if rate != 0.0:
+            failed.append(name)
+    if failed != []:
+        sys.exit(1)